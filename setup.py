@@ -23,6 +23,7 @@ setuptools.setup(name='synapi',
     },
     install_requires=[
       'synapseclient',
+      'requests',
     ],
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -7,31 +7,291 @@
 
 import synapseclient
 import synapseutils
+import requests
+import urllib3
+import functools
+import json
+import concurrent.futures
+import queue
+import threading
+import collections
 import pathlib
 import tempfile
+import tarfile
 import os
-import random
-import string
+import secrets
+import time
+
+# Seconds during which a failed path lookup is remembered before Synapse is
+# asked again
+_MISS_TTL = 10.
+
+# Maximum number of path components kept in the synID cache
+_ID_CACHE_SIZE = 65536
+
+# Maximum number of sessions shared by get_session(), in least recently used
+# order
+_SESSIONS_SIZE = 8
+_sessions = collections.OrderedDict()
+_sessions_lock = threading.Lock()
+
+# Synapse concrete types of the entities handled by this module
+_FILE_TYPE = 'org.sagebionetworks.repo.model.FileEntity'
+_FOLDER_TYPE = 'org.sagebionetworks.repo.model.Folder'
+_PROJECT_TYPE = 'org.sagebionetworks.repo.model.Project'
+
+# Separator of the remote paths, which are not local filesystem paths
+_SEP = '/'
+
+
+def _is_synapse_id(path) -> bool:
+    """
+    @brief Check whether a path is actually a synID (e.g. syn12345678).
+    """
+    return isinstance(path, str) and len(path) > 3 and path.startswith('syn') \
+        and path[3:].isdigit()
+
+
+def _split_remote(path: str) -> tuple:
+    """
+    @brief Split a remote path into its components, ignoring the leading 
+           separator and any empty component (e.g. 'a//b/' -> ('a', 'b')).
+    """
+    return tuple(c for c in path.split(_SEP) if c)
+
+
+def _wait_queue(futures: queue.Queue):
+    """
+    @brief   Wait for the futures in a queue, re-raising the first failure.
+    @details The tasks may queue more futures while we wait. A task queues 
+             its follow-up work before it finishes, so once the queue is 
+             empty and the last future is done, there is nothing left to do.
+
+    @param[in]  futures  Queue of concurrent.futures.Future.
+    """
+    try:
+        while not futures.empty():
+            futures.get().result()
+    except BaseException:
+        # Cancel what has not started and wait for what is running, so that
+        # nothing keeps writing to disk or queueing work once we return
+        while not futures.empty():
+            f = futures.get()
+            if not f.cancel():
+                concurrent.futures.wait([f])
+        raise
+
 
 class SynapseSession:
-    def __init__(self, username: str, password: str, project_id: str):
+    def __init__(self, username: str, password: str, project_id: str,
+                 max_workers: int = None, prewarm_depth: int = 1,
+                 auth_token: str = None):
+        """
+        @brief   Log into Synapse.
+        @details If no auth_token is given, the credentials configured for 
+                 the Synapse client (e.g. in ~/.synapseConfig) are used. 
+                 Synapse no longer accepts passwords, so if there are none
+                 a ValueError is raised.
+
+        @param[in]  username       Synapse username.
+        @param[in]  password       Synapse password. It is not used any more,
+                                   it is only kept for compatibility and can
+                                   be None.
+        @param[in]  project_id     Synapse ID of the project.
+        @param[in]  max_workers    Number of concurrent file transfers. By 
+                                   default, SYNAPI_CONCURRENCY or 8.
+        @param[in]  prewarm_depth  Number of levels of the project tree whose
+                                   synIDs are fetched at login, so that later
+                                   lookups are served from memory. Set it to 
+                                   zero to disable the prewarming.
+        @param[in]  auth_token     Synapse personal access token.
+        """
         # Store params
         self.username = username
         self.password = password
         self.project_id = project_id
+
+        # Set once the user logs out with close()
+        self._closed = False
+
+        # Thread pool used to run file transfers concurrently
+        if max_workers is None:
+            max_workers = int(os.environ.get('SYNAPI_CONCURRENCY', '8'))
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        # Cache of resolved path components, (parent_id, name) -> (id, expiry),
+        # kept in least recently used order
+        self._id_cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # Folders whose full listing is in the cache, synID -> expiry. Names 
+        # missing from a listed folder are known not to exist, and mutations 
+        # made through this session keep the cached listing up to date
+        self._listing_cache = {}
+
+        # Cache of entity types, synID -> concrete type
+        self._stat_cache = {}
         
         # Connect to Synapse
         self.syn = synapseclient.Synapse()
-        self.syn.login(self.username, self.password)
-
-    def __del__(self):
+        if auth_token is not None:
+            self.syn.login(self.username, authToken=auth_token, silent=True)
+        else:
+            try:
+                # Reuse the credentials configured for the Synapse client
+                self.syn.login(self.username, silent=True)
+            except synapseclient.core.exceptions.SynapseAuthenticationError:
+                self._pool.shutdown()
+                raise ValueError('[ERROR] There are no Synapse credentials' \
+                    + ' configured for ' + str(self.username) + ' and' \
+                    + ' Synapse does not accept passwords. Pass a personal' \
+                    + ' access token with auth_token.')
+
+        # Keep a pool of persistent connections to Synapse, so that we do not 
+        # pay a TCP and TLS handshake for every request
+        retry = urllib3.util.Retry(total=5, backoff_factor=0.3)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=32, 
+                                                pool_maxsize=32,
+                                                max_retries=retry)
+        self.syn._requests_session.headers['Connection'] = 'keep-alive'
+        self.syn._requests_session.mount('https://', adapter)
+
+        # Resolve the top levels of the project with one listing per folder,
+        # as almost every path starts there. The caller is about to work on
+        # the project, so names missing from these listings are still looked
+        # up, in case the entities were created with the client directly
+        folder_ids = [self.project_id]
+        for _ in range(prewarm_depth):
+            folder_ids = [child['id'] for folder_id in folder_ids \
+                          for child in self._list_children(folder_id, False) \
+                          if child['type'] == _FOLDER_TYPE]
+
+    def close(self):
+        """
+        @brief   Log out of Synapse.
+        @details The session cannot be used after calling this method. Note 
+                 that sessions obtained with get_session() are shared.
+                 Calling it more than once has no effect.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._pool.shutdown(wait=True)
         self.syn.logout()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+    
+    def _lookup(self, name: str, parent_id: str):
+        """
+        @brief Resolve a single path component, consulting the cache first.
+
+        @param[in]  name       Name of the file or folder.
+        @param[in]  parent_id  Synapse ID of the containing folder/project.
+
+        @returns the synID of the entity or None if it does not exist.
+        """
+        with self._cache_lock:
+            hit = self._id_cache.get((parent_id, name))
+            if hit is not None:
+                entity_id, expiry = hit
+                if expiry is None or expiry > time.monotonic():
+                    self._id_cache.move_to_end((parent_id, name))
+                    return entity_id
+
+            # If the parent was listed recently, the name is not there
+            if self._listing_cache.get(parent_id, 0) > time.monotonic():
+                return None
+
+        # Cache miss, ask Synapse and remember the answer (misses only briefly)
+        entity_id = self.syn.findEntityId(name, parent=parent_id)
+        expiry = None if entity_id else time.monotonic() + _MISS_TTL
+        self._cache_put(parent_id, name, entity_id, expiry)
+        return entity_id
+
+    def _cache_put(self, parent_id: str, name: str, entity_id: str, 
+                   expiry: float = None):
+        """
+        @brief Cache the synID of a path component, evicting the least 
+               recently used entries if the cache is full.
+        """
+        with self._cache_lock:
+            self._id_cache[(parent_id, name)] = (entity_id, expiry)
+            self._id_cache.move_to_end((parent_id, name))
+            while len(self._id_cache) > _ID_CACHE_SIZE:
+                # The listing of the parent is no longer complete in the cache
+                (evicted_parent_id, _), _ = self._id_cache.popitem(last=False)
+                self._listing_cache.pop(evicted_parent_id, None)
+
+    def _cache_store(self, parent_id: str, name: str, entity_id: str,
+                     concrete_type: str = None):
+        """
+        @brief Record that the entity entity_id is called name inside 
+               parent_id and, if known, its type.
+        """
+        self._cache_put(parent_id, name, entity_id)
+        if concrete_type is not None:
+            self._stat_cache[entity_id] = concrete_type
+
+    def _cache_forget(self, entity_id: str):
+        """
+        @brief Drop the cached entries that point to or hang from entity_id.
+        """
+        with self._cache_lock:
+            stale = [k for k, v in self._id_cache.items() \
+                     if v[0] == entity_id or k[0] == entity_id]
+            for k in stale:
+                del self._id_cache[k]
+            self._stat_cache.pop(entity_id, None)
+            self._listing_cache.pop(entity_id, None)
+    
+    def _iter_children(self, folder_id: str, complete: bool = True):
+        """
+        @brief   List a folder, caching the synIDs and types of its children.
+        @details The children are yielded as the pages of the listing arrive.
+
+        @param[in]  folder_id  Synapse ID of the folder/project.
+        @param[in]  complete   Remember for a while that the listing is 
+                               complete, so that missing names need no lookup.
+
+        @returns a generator of the children as returned by getChildren.
+        """
+        for child in self.syn.getChildren(folder_id, 
+                                          includeTypes=['folder', 'file']):
+            self._cache_store(folder_id, child['name'], child['id'], 
+                              child['type'])
+            yield child
+
+        # For a while, names missing from the listing need no lookup either,
+        # but only if the listing was not abandoned halfway
+        if complete:
+            with self._cache_lock:
+                self._listing_cache[folder_id] = time.monotonic() + _MISS_TTL
+
+    def _list_children(self, folder_id: str, complete: bool = True) -> list:
+        """
+        @brief List a folder, caching the synIDs and types of its children.
+
+        @param[in]  folder_id  Synapse ID of the folder/project.
+        @param[in]  complete   Remember for a while that the listing is 
+                               complete, so that missing names need no lookup.
+
+        @returns the list of children as returned by getChildren.
+        """
+        return list(self._iter_children(folder_id, complete))
     
     def get_id(self, path, parent_id=None, sep='/'):
         """
         @brief Get the synID of a Synapse file or folder.
 
         @param[in]  path           Relative path to the possible file or folder.
+                                   It can also be given as a list with the 
+                                   components of the path, already split, 
+                                   or as a synID, which is returned as is.
         @param[in]  parent_id      Synapse ID of the parent folder/project. 
 
         @returns the ID if it exists. Otherwise returns None. 
@@ -41,14 +301,24 @@ class SynapseSession:
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        if path == '/':
-            return parent_id
-        elif sep in path:
-            path_list = path.split(sep)
-            child_id = self.syn.findEntityId(path_list[0], parent=parent_id)
-            return self.get_id(sep.join(path_list[1:]), child_id)
-        else: 
-            return self.syn.findEntityId(path, parent=parent_id)
+        # A synID is already resolved, there is no need to walk anything
+        if _is_synapse_id(path):
+            return path
+
+        # Split the path once, ignoring the leading/trailing separators and
+        # the empty components, so that no lookup is wasted on them. The 
+        # empty path and the root point to the parent itself
+        if not isinstance(path, (list, tuple)):
+            path = path.split(sep)
+        path_list = [c for c in path if c]
+
+        # Walk the path one component at a time
+        entity_id = parent_id
+        for name in path_list:
+            entity_id = self._lookup(name, entity_id)
+            if entity_id is None:
+                return None
+        return entity_id
         
     def exists(self, path: str, concrete_type: list, parent_id=None):
         """
@@ -63,12 +333,49 @@ class SynapseSession:
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
         
-        fsynid = self.get_id(path, parent_id)
-        if fsynid:
-            info = self.syn.get(fsynid, downloadFile=False)
-            return True if info.properties['concreteType'] in concrete_type else False
-        else:
-            return False
+        stat = self._stat(path, parent_id)
+        return stat is not None and stat[1] in concrete_type
+
+    def _get_header(self, entity_id: str) -> dict:
+        """
+        @brief Get the header (synID, name and type) of an entity.
+
+        @param[in]  entity_id  Synapse ID of the entity.
+
+        @returns the EntityHeader JSON of the entity.
+        """
+        return self.syn.restGET('/entity/' + entity_id + '/type')
+
+    def _stat(self, path: str, parent_id: str):
+        """
+        @brief Get the synID and the type of a Synapse file or folder.
+
+        @param[in]  path       Relative path to the possible file or folder.
+        @param[in]  parent_id  Synapse ID of the parent folder/project.
+
+        @returns a tuple (synID, concrete type) if the path exists. Otherwise
+                 returns None.
+        """
+        entity_id = self.get_id(path, parent_id)
+        if entity_id is None:
+            return None
+
+        # The type of an entity never changes, so it is fetched only once. The
+        # entity header is enough, there is no need to fetch the whole entity.
+        # A synID is not checked by get_id(), so its header is always fetched
+        # to find out whether the entity still exists
+        concrete_type = self._stat_cache.get(entity_id)
+        if concrete_type is None or _is_synapse_id(path):
+            try:
+                concrete_type = self._get_header(entity_id)['type']
+            except synapseclient.core.exceptions.SynapseHTTPError as e:
+                # A synID that does not exist or that we cannot read
+                if e.response is not None \
+                        and e.response.status_code in (403, 404):
+                    return None
+                raise
+            self._stat_cache[entity_id] = concrete_type
+        return entity_id, concrete_type
 
     def dir_exists(self, path: str, parent_id=None) -> bool:
         """
@@ -81,9 +388,7 @@ class SynapseSession:
         """
         if path and path[0] == '/':
             path = path[1:]
-        return self.exists(path, ['org.sagebionetworks.repo.model.Folder', 
-                                  'org.sagebionetworks.repo.model.Project'], 
-                           parent_id)
+        return self.exists(path, [_FOLDER_TYPE, _PROJECT_TYPE], parent_id)
 
     def file_exists(self, path: str, parent_id=None) -> bool:
         """
@@ -96,11 +401,10 @@ class SynapseSession:
         """
         if path and path[0] == '/':
             path = path[1:]
-        return self.exists(path, ['org.sagebionetworks.repo.model.FileEntity'], 
-                           parent_id)
+        return self.exists(path, [_FILE_TYPE], parent_id)
 
     def upload(self, local_path: str, remote_path: str, parent_id=None,
-               hidden: bool = False):
+               hidden: bool = False, bundle: bool = False):
         """
         @brief    Upload a file or a directory tree to Synapse.
         @details  This method will overwrite whatever is already stored in the 
@@ -115,64 +419,157 @@ class SynapseSession:
         @param[in]  parent_id    Synapse ID of the parent folder/project.
         @param[in]  hidden       Flag to upload hidden files.
                                  False by default.
+        @param[in]  bundle       Flag to upload a directory as a single tar
+                                 file, which is much faster for trees of many
+                                 small files. It must be downloaded with 
+                                 bundle=True. False by default.
         """
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Remove initial slash if present
-        if remote_path and remote_path[0] == '/':
-            remote_path = remote_path[1:]
+        # Split the remote path into its containing folder and the name
+        path_list = _split_remote(remote_path)
+        if not path_list:
+            raise ValueError('[ERROR] upload() needs the remote path of the' \
+                + ' file or folder to be created inside ' + parent_id + '.')
 
         # Get id of the parent directory containing the remote path
-        if '/' in remote_path:
-            container_path = os.sep.join(remote_path.split(os.sep)[:-1])
-            container_id = self.get_id(container_path, parent_id)
-            # Make sure the destination directory exists
-            if container_id is None:
-                raise OSError('[ERROR] The remote directory ' \
-                    + container_path \
-                    + ' does not exist, so we cannot upload ' \
-                    + local_path + ' to ' + remote_path)
-        else:
-            container_id = parent_id
-
+        container_id = self.get_id(path_list[:-1], parent_id)
+        # Make sure the destination directory exists
+        if container_id is None:
+            raise OSError('[ERROR] The remote directory ' \
+                + _SEP.join(path_list[:-1]) \
+                + ' does not exist, so we cannot upload ' \
+                + local_path + ' to ' + remote_path)
+
+        # A bundled directory is a single file upload, with no folders to create
+        if bundle and os.path.isdir(local_path):
+            self._upload_bundle(local_path, path_list[-1], container_id, hidden)
+            return
+
+        # Walk the local tree in the thread pool, so that the creation of
+        # sibling folders and the file transfers overlap
+        futures = queue.Queue()
+        self._upload(local_path, path_list[-1], container_id, hidden, futures)
+
+        # Wait for all the work, including that queued while waiting
+        _wait_queue(futures)
+
+    def _upload(self, local_path: str, name: str, container_id: str, 
+                hidden: bool, futures: queue.Queue, entry: os.DirEntry = None):
+        """
+        @brief   Upload a file or a directory tree, queueing the work in the 
+                 pool.
+        @details Hidden files are filtered out here, so that no work is 
+                 scheduled for them.
+
+        @param[in]  local_path    Path to the local file/folder.
+        @param[in]  name          Name of the file/folder in Synapse.
+        @param[in]  container_id  Synapse ID of the destination folder/project.
+        @param[in]  hidden        Flag to upload hidden files.
+        @param[out] futures       Queue where the futures of the tasks 
+                                  submitted to the thread pool are put.
+        @param[in]  entry         Directory entry of local_path, if it comes 
+                                  from a directory scan. Its cached file type
+                                  saves stat() calls.
+        """
         # Get just the name of the file/folder, without the rest of the path
-        fname = os.path.basename(local_path)
+        fname = os.path.basename(local_path) if entry is None else entry.name
 
         # Upload file
-        if os.path.isfile(local_path):
+        if os.path.isfile(local_path) if entry is None else entry.is_file():
             if hidden or not fname.startswith('.'):
-                data = synapseclient.File(path=local_path, 
-                                          name=os.path.basename(remote_path), 
-                                          parent=container_id)
-                data = self.syn.store(data)
+                futures.put(self._pool.submit(self._upload_file, local_path,
+                                              name, container_id))
                 
         # Upload directory
-        elif os.path.isdir(local_path):
-            folder = synapseclient.Folder(name=os.path.basename(remote_path), 
-                                          parent=container_id)
-            folder = self.syn.store(folder)
-            
-            # Upload the children files and folders
-            for f in os.listdir(local_path):
-                self.upload(os.path.join(local_path, f), f, 
-                            folder.properties.id, hidden)
+        elif os.path.isdir(local_path) if entry is None else entry.is_dir():
+            futures.put(self._pool.submit(self._upload_dir, local_path, name,
+                                          container_id, hidden, futures))
+
+    def _upload_dir(self, local_path: str, name: str, container_id: str, 
+                    hidden: bool, futures: queue.Queue):
+        """
+        @brief Create a folder in Synapse and queue the upload of its contents.
+
+        @param[in]  local_path    Path to the local folder.
+        @param[in]  name          Name of the folder in Synapse.
+        @param[in]  container_id  Synapse ID of the destination folder/project.
+        @param[in]  hidden        Flag to upload hidden files.
+        @param[out] futures       Queue where the futures of the tasks 
+                                  submitted to the thread pool are put.
+        """
+        # The folder must exist before its children, as they need its synID
+        folder = synapseclient.Folder(name=name, parent=container_id)
+        folder = self.syn.store(folder)
+        self._cache_store(container_id, folder.properties.name,
+                          folder.properties.id, _FOLDER_TYPE)
+        
+        # Upload the children files and folders, the directory scan tells us
+        # their type without stat'ing each of them
+        with os.scandir(local_path) as it:
+            entries = list(it)
+        for e in entries:
+            self._upload(e.path, e.name, folder.properties.id, hidden, futures,
+                         e)
+
+    def _upload_file(self, local_path: str, name: str, container_id: str):
+        """
+        @brief Upload a single file to Synapse.
+
+        @param[in]  local_path    Path to the local file.
+        @param[in]  name          Name of the file in Synapse.
+        @param[in]  container_id  Synapse ID of the destination folder/project.
+        """
+        data = synapseclient.File(path=local_path, name=name, 
+                                  parent=container_id)
+        data = self.syn.store(data)
+        self._cache_store(container_id, data.properties.name,
+                          data.properties.id, _FILE_TYPE)
+
+    def _upload_bundle(self, local_path: str, name: str, container_id: str,
+                       hidden: bool):
+        """
+        @brief Upload a directory tree to Synapse as a single tar file.
+
+        @param[in]  local_path    Path to the local folder.
+        @param[in]  name          Name of the tar file in Synapse.
+        @param[in]  container_id  Synapse ID of the destination folder/project.
+        @param[in]  hidden        Flag to upload hidden files.
+        """
+        # Leave the hidden files out, as a non-bundled upload would do
+        def tar_filter(tarinfo):
+            if not hidden and tarinfo.isfile() \
+                    and os.path.basename(tarinfo.name).startswith('.'):
+                return None
+            return tarinfo
+
+        # Pack the contents of the directory, relative to it, and upload them
+        with tempfile.TemporaryDirectory(prefix='.synapi_') as tmp_dir:
+            tar_path = os.path.join(tmp_dir, name)
+            with tarfile.open(tar_path, 'w') as tar:
+                with os.scandir(local_path) as it:
+                    for e in it:
+                        tar.add(e.path, arcname=e.name, filter=tar_filter)
+            self._upload_file(tar_path, name, container_id)
 
     def download(self, remote_path: str, local_path, parent_id=None,
-                 synapse_file_type: str = 'org.sagebionetworks.repo.model.FileEntity',
-                 synapse_dir_type: str = 'org.sagebionetworks.repo.model.Folder'):
+                 synapse_file_type: str = _FILE_TYPE,
+                 synapse_dir_type: str = _FOLDER_TYPE, bundle: bool = False):
         """
         @param[in]  remote_path  Relative path (from parent_id) to a file or
                                  folder stored in Synapse.
         @param[in]  local_path   Path to the destination file/folder in the
                                  local filesystem. It must not exist.
+        @param[in]  bundle       Flag to download a directory uploaded with 
+                                 bundle=True, which is unpacked into 
+                                 local_path. False by default.
         """
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Remove initial slash if present
-        if remote_path and remote_path[0] == '/':
-            remote_path = remote_path[1:]
+        # Normalise the remote path (e.g. no initial slash)
+        remote_path = _SEP.join(_split_remote(remote_path))
 
         # Check that the destination file/folder does not exist
         if os.path.exists(local_path):
@@ -187,36 +584,201 @@ class SynapseSession:
                 + remote_path + ' to ' + local_path \
                 + ' because the parent of ' + local_path + ' does not exist.')
         
-        # If the remote path points to a file
-        if self.file_exists(remote_path, parent_id):
-            entity = self.syn.get(self.get_id(remote_path, parent_id), 
-                                  downloadFile=True,
-                                  downloadLocation=tempfile.gettempdir(),
-                                  ifcollision='overwrite.local')
-            os.rename(entity['path'], local_path) 
-        
-        # If the remote path points to a folder
-        elif self.dir_exists(remote_path, parent_id):
-            # Create a directory in the local path with the same name
-            os.mkdir(local_path)
+        # Find out whether the remote path points to a file or a folder
+        stat = self._stat(remote_path, parent_id)
+        if stat is None or stat[1] not in [_FILE_TYPE, _FOLDER_TYPE, 
+                                           _PROJECT_TYPE]:
+            raise ValueError('[ERROR] The remote path ' \
+                + remote_path + ' does not point to a valid ' \
+                + 'file or a folder in Synapse.')
+        remote_id, concrete_type = stat
+
+        # A bundle is a single file that is unpacked into the local path
+        if bundle:
+            if concrete_type != _FILE_TYPE:
+                raise ValueError('[ERROR] The remote path ' \
+                    + remote_path + ' is not a bundle uploaded with ' \
+                    + 'bundle=True.')
+            self._download_bundle(remote_id, local_path)
+            return
+
+        # Walk the remote tree breadth-first in the thread pool, so that the
+        # folder listings and the file transfers of the whole tree overlap
+        futures = queue.Queue()
+        self._download_by_id(remote_id, concrete_type, local_path, futures)
+
+        # Wait for all the work, including that queued while waiting
+        _wait_queue(futures)
+
+    def download_many(self, pairs: list, parent_id=None, 
+                      max_inflight: int = 16):
+        """
+        @brief   Download several files or folders concurrently.
+        @details All the remote paths are resolved first, in parallel, and 
+                 then the transfers are run concurrently. This is a 
+                 generator, the downloads run while it is being iterated.
+                 The order of the pairs is not preserved.
+
+        @param[in]  pairs         List of (remote_path, local_path) tuples, 
+                                  as they would be passed to download().
+        @param[in]  parent_id     Synapse ID of the parent folder/project.
+        @param[in]  max_inflight  Maximum number of downloads in flight.
+
+        @returns each (remote_path, local_path) pair once it is downloaded.
+        """
+        return self._transfer_many(self.download, pairs, parent_id,
+                                   max_inflight, warm_up=True)
+
+    def upload_many(self, pairs: list, parent_id=None, hidden: bool = False,
+                    max_inflight: int = 16):
+        """
+        @brief   Upload several files or folders concurrently.
+        @details This is a generator, the uploads run while it is being 
+                 iterated. The order of the pairs is not preserved.
+
+        @param[in]  pairs         List of (local_path, remote_path) tuples, 
+                                  as they would be passed to upload().
+        @param[in]  parent_id     Synapse ID of the parent folder/project.
+        @param[in]  hidden        Flag to upload hidden files.
+                                  False by default.
+        @param[in]  max_inflight  Maximum number of uploads in flight.
+
+        @returns each (local_path, remote_path) pair once it is uploaded.
+        """
+        upload = functools.partial(self.upload, hidden=hidden)
+        return self._transfer_many(upload, pairs, parent_id, max_inflight)
+
+    def _transfer_many(self, transfer, pairs: list, parent_id, 
+                       max_inflight: int, warm_up: bool = False):
+        """
+        @brief Run a transfer method over several pairs of paths concurrently.
 
-            # Get synID of the remote directory
-            remote_id = self.get_id(remote_path, parent_id)
+        @param[in]  transfer      Method called as transfer(src, dst, parent_id).
+        @param[in]  pairs         List of (src, dst) tuples.
+        @param[in]  parent_id     Synapse ID of the parent folder/project.
+        @param[in]  max_inflight  Maximum number of transfers in flight.
+        @param[in]  warm_up       Resolve the source remote paths in parallel
+                                  before starting the transfers.
 
-            # List all the files and folders inside the remote folder
-            children = self.syn.getChildren(remote_id, 
-                                            includeTypes=['folder', 'file'])
+        @returns each pair once its transfer is finished.
+        """
+        # The project is the parent if none is specified
+        parent_id = self.project_id if parent_id is None else parent_id
 
-            # Download all the children files and folders
-            for child in children:
-                self.download(child['name'], 
-                              os.path.join(local_path, child['name']),
-                              remote_id)
+        # The transfers wait on the session pool, so they run in their own 
+        # pool to avoid blocking it
+        ex = concurrent.futures.ThreadPoolExecutor(max_workers=max_inflight)
+        futures = {}
+        try:
+            # Resolve all the remote paths at once, filling the caches
+            if warm_up:
+                list(ex.map(lambda p: self._stat(p[0].lstrip('/'), parent_id),
+                            pairs))
+
+            futures = {ex.submit(transfer, src, dst, parent_id): (src, dst) \
+                       for src, dst in pairs}
+            for f in concurrent.futures.as_completed(futures):
+                f.result()
+                yield futures[f]
+        finally:
+            for f in futures:
+                f.cancel()
+            ex.shutdown(wait=True)
+
+    def _download_by_id(self, entity_id: str, concrete_type: str,
+                        local_path: str, futures: queue.Queue):
+        """
+        @brief   Download a file or folder, queueing the work in the pool.
+        @details The synID and type of the entity must be already known, so 
+                 no lookups are performed. 
 
+        @param[in]  entity_id      Synapse ID of the file or folder.
+        @param[in]  concrete_type  Synapse entity type.
+        @param[in]  local_path     Path to the destination file/folder in the
+                                   local filesystem. It must not exist.
+        @param[out] futures        Queue where the futures of the tasks 
+                                   submitted to the thread pool are put.
+        """
+        # If the entity is a folder, recreate it locally and list it in the 
+        # pool
+        if concrete_type in [_FOLDER_TYPE, _PROJECT_TYPE]:
+            os.mkdir(local_path)
+            futures.put(self._pool.submit(self._download_children, entity_id,
+                                          local_path, futures))
         else:
-            raise ValueError('[ERROR] The remote path ' \
-                + remote_path + ' does not point to a valid ' \
-                + 'file or a folder in Synapse.')
+            futures.put(self._pool.submit(self._download_file, entity_id,
+                                          local_path))
+
+    def _download_children(self, folder_id: str, local_path: str, 
+                           futures: queue.Queue):
+        """
+        @brief Download the contents of a folder, queueing the work in the pool.
+
+        @param[in]  folder_id   Synapse ID of the folder.
+        @param[in]  local_path  Path to the local folder, it must exist.
+        @param[out] futures     Queue where the futures of the tasks submitted
+                                to the thread pool are put.
+        """
+        # The listing already tells us the synID and type of each child
+        for child in self._list_children(folder_id):
+            self._download_by_id(child['id'], child['type'],
+                                 os.path.join(local_path, child['name']),
+                                 futures)
+
+    def _download_file(self, file_id: str, local_path: str):
+        """
+        @brief Download a single Synapse file.
+
+        @param[in]  file_id     Synapse ID of the file.
+        @param[in]  local_path  Path to the destination file.
+        """
+        # Each transfer gets its own temporary folder, so that concurrent 
+        # downloads of files with the same name do not collide. It is created
+        # next to the destination, so that the final rename stays within the
+        # same filesystem and does not copy the data again
+        container_path = os.path.dirname(os.path.abspath(local_path))
+        with tempfile.TemporaryDirectory(prefix='.synapi_', 
+                                         dir=container_path) as tmp_dir:
+            entity = self.syn.get(file_id, downloadFile=True,
+                                  downloadLocation=tmp_dir,
+                                  ifcollision='overwrite.local')
+            os.rename(entity['path'], local_path) 
+
+    def _download_bundle(self, file_id: str, local_path: str):
+        """
+        @brief Download a tar file and unpack it into a new directory.
+
+        @param[in]  file_id     Synapse ID of the tar file.
+        @param[in]  local_path  Path to the destination directory.
+        """
+        # The archive is fetched and unpacked next to the destination, so 
+        # that the directory only appears there once it is complete
+        container_path = os.path.dirname(os.path.abspath(local_path))
+        with tempfile.TemporaryDirectory(prefix='.synapi_', 
+                                         dir=container_path) as tmp_dir:
+            archive_path = os.path.join(tmp_dir, 'archive')
+            tree_path = os.path.join(tmp_dir, 'tree')
+            os.mkdir(archive_path)
+            os.mkdir(tree_path)
+            entity = self.syn.get(file_id, downloadFile=True,
+                                  downloadLocation=archive_path,
+                                  ifcollision='overwrite.local')
+            with tarfile.open(entity['path']) as tar:
+                # Never let the archive write outside of the directory
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(tree_path, filter='data')
+                else:
+                    root = os.path.realpath(tree_path) + os.sep
+                    for m in tar.getmembers():
+                        path = os.path.realpath(os.path.join(tree_path, 
+                                                             m.name))
+                        if not path.startswith(root) or m.issym() \
+                                or m.islnk():
+                            raise ValueError('[ERROR] The bundle ' \
+                                + file_id + ' contains the unsafe entry ' \
+                                + m.name + '.')
+                    tar.extractall(tree_path)
+            os.rename(tree_path, local_path)
 
     def mkdir(self, path: str, parent_id=None):
         """
@@ -230,32 +792,37 @@ class SynapseSession:
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Remove initial slash (if present)
-        if path and path[0] == '/':
-            path = path[1:]
-
-        # If the last folder of the path exists, we should not be creating it
-        if self.dir_exists(path, parent_id): 
-            raise ValueError('[ERROR] Cannot create a folder that already exists.' \
-                + ' There is already a ' + path + ' in ' + parent_id + '.')
-       
-        # Create all the folders of the provided path
-        path_list = path.split(os.sep)
-        child_id = None
-        if self.dir_exists(path_list[0], parent_id):
-            child_id = self.get_id(path_list[0], parent_id)
-        else:
-            # Create folder
-            folder = synapseclient.Folder(path_list[0], parent_id)
-            folder = self.syn.store(folder, createOrUpdate=False)
-            child_id = folder.properties.id
+        # Split the path, ignoring the initial slash (if present)
+        path_list = _split_remote(path)
+        if not path_list:
+            raise ValueError('[ERROR] mkdir() needs the path of the folder' \
+                + ' to be created inside ' + parent_id + '.')
+
+        # Create all the folders of the provided path, walking it one folder
+        # at a time and probing each of them only once
+        child_id = parent_id
+        created = False
+        for i, name in enumerate(path_list):
+            # Below a folder we just created there is nothing to look up
+            entity_id = None if created else self.get_id([name], child_id)
+            if entity_id is None:
+                # Create folder
+                folder = synapseclient.Folder(name, child_id)
+                folder = self.syn.store(folder, createOrUpdate=False)
+                self._cache_store(child_id, name, folder.properties.id, 
+                                  _FOLDER_TYPE)
+                child_id = folder.properties.id
+                created = True
+            elif i == len(path_list) - 1:
+                # If the last folder of the path exists, we should not be 
+                # creating it
+                raise ValueError('[ERROR] Cannot create a folder that already exists.' \
+                    + ' There is already a ' + path + ' in ' + parent_id + '.')
+            else:
+                child_id = entity_id
         
-        # Keep traversing the path if we have not finished yet, otherwise return 
-        # the synID of the last (and new) folder
-        if len(path_list) == 1:
-            return child_id
-        else:
-            return self.mkdir(os.sep.join(path_list[1:]), child_id)
+        # Return the synID of the last (and new) folder
+        return child_id
 
     def rm(self, path: str, parent_id=None):
         """
@@ -264,20 +831,73 @@ class SynapseSession:
         @param[in]  path        Relative path to the file or folder to be deleted.
         @param[in]  parent_id   Synapse ID of the parent folder/project.
 
+        @returns nothing.
+        """
+        self.rm_many([path], parent_id)
+
+    def rm_many(self, paths: list, parent_id=None):
+        """
+        @brief   Delete several files or folders concurrently.
+        @details All the paths are resolved (in parallel) before anything is 
+                 deleted, so if one of them does not exist nothing is deleted.
+                 Paths inside other folders being deleted are skipped, as 
+                 they go away with them.
+
+        @param[in]  paths       List of relative paths to the files or folders
+                                to be deleted.
+        @param[in]  parent_id   Synapse ID of the parent folder/project.
+
         @returns nothing.
         """
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Remove initial slash if present
-        if path and path[0] == '/':
-            path = path[1:]
-
-        entity_id = self.get_id(path, parent_id)
-        if entity_id is None:
-            raise ValueError('[ERROR] The file in ' + path \
-                + ' that you are trying to delete does not exist.')
-        self.syn.delete(entity_id)
+        # Normalise the paths (e.g. no initial slash)
+        paths = [_SEP.join(_split_remote(p)) for p in paths]
+
+        # An empty path points to the parent itself, we do not delete that
+        if not all(paths):
+            raise ValueError('[ERROR] rm() needs the path of a file or folder' \
+                + ' inside ' + parent_id + '.')
+
+        # Skip the paths that hang from other paths being deleted
+        paths = [p for p in paths \
+                 if not any(p.startswith(q + _SEP) for q in paths)]
+
+        # Resolve all the paths at once
+        entity_ids = list(self._pool.map(lambda p: self.get_id(p, parent_id),
+                                         paths))
+        for path, entity_id in zip(paths, entity_ids):
+            if entity_id is None:
+                raise ValueError('[ERROR] The file in ' + path \
+                    + ' that you are trying to delete does not exist.')
+
+        # Delete them all concurrently, waiting for all of them even if one
+        # fails, so that nothing is left running. Only the entities that were
+        # deleted are forgotten, those that failed are still there
+        futures = {self._pool.submit(self.syn.delete, entity_id): entity_id \
+                   for entity_id in set(entity_ids)}
+        concurrent.futures.wait(futures)
+        deleted = set()
+        for f, entity_id in futures.items():
+            if f.exception() is None:
+                self._cache_forget(entity_id)
+                deleted.add(entity_id)
+
+        # Remember for a while that the names are gone, so that checking them
+        # right after deleting them needs no lookup. Their folders are still 
+        # in the cache
+        expiry = time.monotonic() + _MISS_TTL
+        for path, entity_id in zip(paths, entity_ids):
+            if entity_id in deleted and not _is_synapse_id(path):
+                path_list = _split_remote(path)
+                container_id = self.get_id(path_list[:-1], parent_id)
+                self._cache_put(container_id, path_list[-1], None, expiry)
+
+        # Report the first deletion that failed
+        for f in futures:
+            if f.exception() is not None:
+                raise f.exception()
 
     def get_parent_id(self, path: str, parent_id=None) -> str:
         """
@@ -295,57 +915,100 @@ class SynapseSession:
         
         if path == '/' and parent_id == self.project_id:
             raise ValueError('[ERROR] The project does not have a parent.')
-        elif '/' in path:
-            return self.get_id(os.sep.join(path.split(os.sep)[:-1]), parent_id)
+        
+        # Split the path only once and resolve all but its last component
+        path_list = _split_remote(path)
+        if len(path_list) > 1:
+            return self.get_id(path_list[:-1], parent_id)
         else:
             return parent_id
 
-    def mv(self, src_path: str, dst_path: str, parent_id=None):   
+    def _update_entity(self, entity_id: str, **properties):
         """
-        @brief   Moves a file or folder from the src_path to the dst_path.
-        @details The destination path must not exist.
+        @brief   Change some properties (e.g. name, parentId) of an entity.
+        @details The entity JSON is patched directly rather than fetching and
+                 storing a full Entity object. Synapse requires the current 
+                 etag, so one GET is needed before the PUT.
+
+        @param[in]  entity_id   Synapse ID of the entity.
+        @param[in]  properties  New values of the properties.
+
+        @returns the updated entity JSON.
+        """
+        e = self.syn.restGET('/entity/' + entity_id)
+        e.update(properties)
+        return self.syn.restPUT('/entity/' + entity_id, body=json.dumps(e))
+
+    def _resolve_src_dst(self, src_path: str, dst_path: str, parent_id: str,
+                         caller: str):
+        """
+        @brief Resolve and validate the source and destination of a mv/cp.
 
         @param[in]  src_path   Remote relative path (from parent_id).
         @param[in]  dst_path   Remote relative path (from parent_id).
         @param[in]  parent_id  Synapse ID of the parent folder/project.
+        @param[in]  caller     Name of the calling method, for the errors.
 
-        @returns nothing.    
+        @returns a tuple (source synID, synID of the destination folder).
         """
-        # The project is the parent if none is specified
-        parent_id = self.project_id if parent_id is None else parent_id
-
-        # Remove initial slash if present
-        if dst_path and dst_path[0] == '/':
-            dst_path = dst_path[1:]
+        # An empty path points to the parent itself, we do not move or copy
+        # that, nor onto that
+        if not _split_remote(src_path) or not _split_remote(dst_path):
+            raise ValueError('[ERROR] ' + caller + '() needs the paths of' \
+                + ' files or folders inside ' + parent_id + '.')
 
         # Check the the source file/folder exists
-        if self.get_id(src_path, parent_id) is None:
-            raise ValueError('[ERROR] mv() source ' + src_path \
+        src_id = self.get_id(src_path, parent_id)
+        if src_id is None:
+            raise ValueError('[ERROR] ' + caller + '() source ' + src_path \
                 + ' does not exist.')
 
         # Check that the destination file/folder does not exist, 
         # we do not want to overwrite it 
         if self.get_id(dst_path, parent_id) is not None:
-            raise ValueError('[ERROR] mv() destination ' + dst_path \
-                + ' already exists.')
+            raise ValueError('[ERROR] ' + caller + '() destination ' \
+                + dst_path + ' already exists.')
 
         # Check that the parent of the destination file/folder exists
         dst_path_parent_id = self.get_parent_id(dst_path, parent_id)
         if dst_path_parent_id is None:
-            raise ValueError('[ERROR] mv() cannot move ' + src_path \
-                + ' into the path ' + dst_path \
+            raise ValueError('[ERROR] ' + caller + '() cannot move ' \
+                + src_path + ' into the path ' + dst_path \
                 + ' because the parent folder of this destination path' \
                 + ' does not exist.')
 
-        # Move entity to the requested container folder
-        src_id = self.get_id(src_path, parent_id)
-        self.syn.move(src_id, dst_path_parent_id)
+        return src_id, dst_path_parent_id
+
+    def mv(self, src_path: str, dst_path: str, parent_id=None):   
+        """
+        @brief   Moves a file or folder from the src_path to the dst_path.
+        @details The destination path must not exist.
+
+        @param[in]  src_path   Remote relative path (from parent_id).
+        @param[in]  dst_path   Remote relative path (from parent_id).
+        @param[in]  parent_id  Synapse ID of the parent folder/project.
+
+        @returns nothing.    
+        """
+        # The project is the parent if none is specified
+        parent_id = self.project_id if parent_id is None else parent_id
+
+        # Normalise the destination path (e.g. no initial slash)
+        dst_path = _SEP.join(_split_remote(dst_path))
+
+        # Resolve the source and the destination folder, only once
+        src_id, dst_path_parent_id = self._resolve_src_dst(src_path, dst_path,
+                                                           parent_id, 'mv')
 
-        # Rename the filename if requested
-        dst_fname = os.path.basename(dst_path)
-        e = self.syn.get(src_id, downloadFile=False)
-        e.properties['name'] = dst_fname
-        e = self.syn.store(e)
+        # Move entity to the requested container folder and rename it, both
+        # in a single update, so that its name can never clash on the way
+        dst_fname = _split_remote(dst_path)[-1]
+        self._update_entity(src_id, parentId=dst_path_parent_id, name=dst_fname)
+
+        # Update the cached location of the moved entity, its type is the same
+        concrete_type = self._stat_cache.get(src_id)
+        self._cache_forget(src_id)
+        self._cache_store(dst_path_parent_id, dst_fname, src_id, concrete_type)
 
     def cp(self, src_path: str, dst_path: str, parent_id=None):
         """
@@ -361,48 +1024,77 @@ class SynapseSession:
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Remove initial slash if present
-        if dst_path and dst_path[0] == '/':
-            dst_path = dst_path[1:]
-
-        # Check the the source file/folder exists
-        if self.get_id(src_path, parent_id) is None:
-            raise ValueError('[ERROR] mv() source ' + src_path \
-                + ' does not exist.')
+        # Normalise the destination path (e.g. no initial slash)
+        dst_path = _SEP.join(_split_remote(dst_path))
+
+        # Resolve the source and the destination folder, only once
+        src_id, dst_path_parent_id = self._resolve_src_dst(src_path, dst_path,
+                                                           parent_id, 'cp')
+
+        # If the destination folder has nothing named like the source, we can 
+        # copy straight into it and rename the copy if needed
+        src_fname = _split_remote(src_path)[-1]
+        if _is_synapse_id(src_path):
+            src_fname = self._get_header(src_id)['name']
+        dst_fname = _split_remote(dst_path)[-1]
+        if self.get_id([src_fname], dst_path_parent_id) is None:
+            copied = synapseutils.copy(self.syn, src_id, dst_path_parent_id,
+                                       updateExisting=False)
+            dst_id = copied[src_id]
+            if dst_fname != src_fname:
+                self._update_entity(dst_id, name=dst_fname)
+            self._cache_store(dst_path_parent_id, dst_fname, dst_id,
+                              self._stat_cache.get(src_id))
+            return
+
+        # Otherwise the copy would clash with the existing entity, so we copy
+        # it into a temporary folder first. Its random name cannot clash with
+        # anything, so it is created straight away without looking it up
+        temp_dir_name = 'synapi_tmp_' + secrets.token_hex(8)
+        temp_dir = synapseclient.Folder(temp_dir_name, parent_id)
+        temp_dir = self.syn.store(temp_dir, createOrUpdate=False)
+        temp_dir_id = temp_dir.properties.id
         
-        # Check that the destination file/folder does not exist, 
-        # we do not want to overwrite it 
-        if self.get_id(dst_path, parent_id) is not None:
-            raise ValueError('[ERROR] mv() destination ' + dst_path \
-                + ' already exists.')
+        # Copy entity to the temporary folder
+        copied = synapseutils.copy(self.syn, src_id, temp_dir_id)
 
-        # Check that the parent of the destination file/folder exists
-        dst_path_parent_id = self.get_parent_id(dst_path, parent_id)
-        if dst_path_parent_id is None:
-            raise ValueError('[ERROR] mv() cannot move ' + src_path \
-                + ' into the path ' + dst_path \
-                + ' because the parent folder of this destination path' \
-                + ' does not exist.')
+        # Move the copy from temporary folder to destination path, renaming it
+        # in the same update so that it never clashes with the source
+        dst_id = copied[src_id]
+        self._update_entity(dst_id, parentId=dst_path_parent_id, name=dst_fname)
+        self._cache_store(dst_path_parent_id, dst_fname, dst_id,
+                          self._stat_cache.get(src_id))
 
-        # Create temporary folder
-        temp_dir_name = ''.join(random.choice(string.ascii_lowercase) for i in range(10))
-        self.mkdir(temp_dir_name, parent_id)
-        
-        # Copy entity to the temporary folder
-        src_id = self.get_id(src_path, parent_id)
-        synapseutils.copy(self.syn, src_id, self.get_id(temp_dir_name, parent_id))
+        # Remove temporary folder, which was never cached
+        self.syn.delete(temp_dir_id)
+
+    def ls(self, remote_path: str, parent_id=None):
+        """
+        @brief   List the contents of a directory in Synapse.
+        @details The names are yielded as the listing arrives from Synapse,
+                 so large folders are never held in memory. The directory
+                 is checked straight away, not when the names are consumed.
 
-        # Move entity from temporary folder to destination path
-        temp_dir_id = self.get_id(temp_dir_name, parent_id)
-        src_fname = os.path.basename(src_path)
-        dst_fname = os.path.basename(dst_path)
-        self.mv(src_fname, dst_fname, temp_dir_id)
-        self.mv(os.path.join(temp_dir_name, dst_fname), dst_path)
+        @param[in]  remote_path  Relative path (from the parent_id) to the
+                                 directory you want to list.
+        @param[in]  parent_id    SynID of the directory that serves as a base
+                                 for the path.
+
+        @returns a generator of the names of the files and folders.  
+        """
+        # The project is the parent if none is specified
+        parent_id = self.project_id if parent_id is None else parent_id
+
+        # Make sure that the directory exists, getting its synID on the way
+        stat = self._stat(_SEP.join(_split_remote(remote_path)), parent_id)
+        if stat is None or stat[1] not in [_FOLDER_TYPE, _PROJECT_TYPE]:
+            raise OSError('[ERROR] The directory ' + remote_path \
+                          + ' does not exist.')
 
-        # Remove temporary folder
-        self.rm(temp_dir_name, parent_id)
+        # List all the files and folders inside the remote folder
+        return (x['name'] for x in self._iter_children(stat[0]))
 
-    def ls(self, remote_path: str, parent_id=None) -> list:
+    def ls_list(self, remote_path: str, parent_id=None) -> list:
         """
         @brief List the contents of a directory in Synapse.
 
@@ -411,24 +1103,81 @@ class SynapseSession:
         @param[in]  parent_id    SynID of the directory that serves as a base
                                  for the path.
 
-        @returns a list with the names of the file and folders.  
+        @returns a list with the names of the files and folders.  
+        """
+        return list(self.ls(remote_path, parent_id))
+
+    def list_tree(self, remote_path: str, parent_id=None) -> set:
+        """
+        @brief   List recursively the contents of a directory in Synapse.
+        @details The folders of each level of the tree are listed 
+                 concurrently, one request per folder.
+
+        @param[in]  remote_path  Relative path (from the parent_id) to the
+                                 directory you want to list.
+        @param[in]  parent_id    SynID of the directory that serves as a base
+                                 for the path.
+
+        @returns a set with the paths of all the files and folders in the 
+                 tree, relative to remote_path (e.g. 'foo/bar.txt').
         """
         # The project is the parent if none is specified
         parent_id = self.project_id if parent_id is None else parent_id
 
-        # Make sure that the directory exists
-        if not self.dir_exists(remote_path, parent_id):
+        # Make sure that the directory exists, getting its synID on the way
+        stat = self._stat(_SEP.join(_split_remote(remote_path)), parent_id)
+        if stat is None or stat[1] not in [_FOLDER_TYPE, _PROJECT_TYPE]:
             raise OSError('[ERROR] The directory ' + remote_path \
                           + ' does not exist.')
 
-        # Get the synID of the folder
-        dir_id = self.get_id(remote_path, parent_id)
-
-        # List all the files and folders inside the remote folder
-        children = self.syn.getChildren(dir_id, includeTypes=['folder', 'file'])
-        files = [x['name'] for x in children]
-        
-        return files
+        # Walk the tree one level at a time, listing its folders in parallel
+        tree = set()
+        level = [(stat[0], '')]
+        while level:
+            listings = self._pool.map(lambda f: self._list_children(f[0]), 
+                                      level)
+            next_level = []
+            for (_, prefix), children in zip(level, listings):
+                for child in children:
+                    path = prefix + child['name']
+                    tree.add(path)
+                    if child['type'] == _FOLDER_TYPE:
+                        next_level.append((child['id'], path + _SEP))
+            level = next_level
+
+        return tree
+
+
+def get_session(username: str, password: str, project_id: str, 
+                auth_token: str = None) -> SynapseSession:
+    """
+    @brief   Get a logged in Synapse session.
+    @details Sessions are memoized, so repeated calls with the same 
+             credentials within a process reuse the same connection to 
+             Synapse instead of logging in again. A shared session that has
+             been closed is replaced by a new one.
+
+    @param[in]  username    Synapse username.
+    @param[in]  password    Synapse password (not used any more).
+    @param[in]  project_id  Synapse ID of the project.
+    @param[in]  auth_token  Synapse personal access token.
+
+    @returns a SynapseSession shared by all the callers with the same arguments.
+    """
+    key = (username, password, project_id, auth_token)
+    with _sessions_lock:
+        sess = _sessions.get(key)
+        if sess is None or sess._closed:
+            sess = SynapseSession(username, password, project_id, 
+                                  auth_token=auth_token)
+            _sessions[key] = sess
+        _sessions.move_to_end(key)
+
+        # Forget the least recently used sessions, without closing them as
+        # someone may still be using them
+        while len(_sessions) > _SESSIONS_SIZE:
+            _sessions.popitem(last=False)
+    return sess
 
 
 if __name__ == '__main__':
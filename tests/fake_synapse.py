@@ -0,0 +1,212 @@
+"""
+@brief  In-memory stand-in for synapseclient.Synapse used by the offline tests.
+@author Luis Carlos Garcia Peraza Herrera (luiscarlos.gph@gmail.com).
+@date   15 Oct 2026.
+"""
+import collections
+import itertools
+import json
+import os
+import threading
+import requests
+import synapseclient
+from synapseclient.entity import Entity
+
+_FILE_TYPE = 'org.sagebionetworks.repo.model.FileEntity'
+_FOLDER_TYPE = 'org.sagebionetworks.repo.model.Folder'
+_PROJECT_TYPE = 'org.sagebionetworks.repo.model.Project'
+
+
+def _http_error(message: str, status_code: int):
+    """
+    @brief Build the error that Synapse would answer with.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    return synapseclient.core.exceptions.SynapseHTTPError(message,
+                                                          response=response)
+
+
+class FakeSynapse:
+    """
+    @brief Dict-backed fake of the subset of synapseclient.Synapse used by
+           synapi. Every instance shares the same repository, as sessions
+           with the same credentials would.
+    """
+    _lock = threading.RLock()
+    _entities = {}
+    _children = collections.defaultdict(dict)
+    _data = {}
+    _ids = itertools.count(1000)
+
+    # Users with credentials configured for the client (e.g. ~/.synapseConfig)
+    configured_users = set()
+
+    def __init__(self, *args, **kwargs):
+        self._requests_session = requests.Session()
+
+    @classmethod
+    def reset(cls):
+        """
+        @brief Empty the repository.
+        """
+        with cls._lock:
+            cls._entities.clear()
+            cls._children.clear()
+            cls._data.clear()
+
+    @classmethod
+    def create_project(cls, name: str) -> str:
+        """
+        @brief Create an empty project and return its synID.
+        """
+        with cls._lock:
+            return cls._create({'concreteType': _PROJECT_TYPE, 'name': name,
+                                'parentId': None})
+
+    @classmethod
+    def _create(cls, properties: dict) -> str:
+        entity_id = 'syn' + str(next(cls._ids))
+        properties = dict(properties, id=entity_id,
+                          etag=str(next(cls._ids)))
+        cls._entities[entity_id] = properties
+        if properties['parentId'] is not None:
+            cls._children[properties['parentId']][properties['name']] = entity_id
+        return entity_id
+
+    def _check(self, entity_id: str) -> dict:
+        if entity_id not in self._entities:
+            raise _http_error(
+                'Entity ' + str(entity_id) + ' does not exist.', 404)
+        return self._entities[entity_id]
+
+    def _relocate(self, entity_id: str, parent_id: str, name: str):
+        properties = self._entities[entity_id]
+        if self._children[parent_id].get(name, entity_id) != entity_id:
+            raise _http_error(
+                'An entity named ' + name + ' already exists.', 409)
+        del self._children[properties['parentId']][properties['name']]
+        self._children[parent_id][name] = entity_id
+        properties.update(parentId=parent_id, name=name,
+                          etag=str(next(self._ids)))
+
+    def login(self, email: str = None, silent: bool = False, 
+              authToken: str = None, profile: str = 'default'):
+        # Same signature as synapseclient 4, which has no password login
+        if authToken is None and email not in self.configured_users:
+            raise synapseclient.core.exceptions.SynapseAuthenticationError(
+                'No credentials provided.')
+
+    def logout(self):
+        pass
+
+    def findEntityId(self, name, parent=None):
+        with self._lock:
+            return self._children.get(parent, {}).get(name)
+
+    def getChildren(self, parent, includeTypes=None, **kwargs):
+        with self._lock:
+            self._check(parent)
+            children = [self._entities[i] \
+                        for i in self._children[parent].values()]
+        for child in sorted(children, key=lambda c: c['name']):
+            yield {'id': child['id'], 'name': child['name'],
+                   'type': child['concreteType']}
+
+    def get(self, entity, downloadFile=True, downloadLocation=None,
+            ifcollision='keep.both', **kwargs):
+        with self._lock:
+            properties = dict(self._check(synapseclient.core.utils.id_of(entity)))
+            data = self._data.get(properties['id'])
+        local_state = {}
+        if downloadFile and properties['concreteType'] == _FILE_TYPE:
+            path = os.path.join(downloadLocation, properties['name'])
+            if os.path.exists(path) and ifcollision != 'overwrite.local':
+                raise OSError('Fake download would clash with ' + path)
+            with open(path, 'wb') as f:
+                f.write(data)
+            local_state['path'] = path
+        return Entity.create(properties, {}, local_state)
+
+    def store(self, obj, createOrUpdate=True, forceVersion=True, **kwargs):
+        with self._lock:
+            properties = obj.properties
+            parent_id = properties['parentId']
+            name = properties['name']
+            if 'id' in properties:
+                entity_id = properties['id']
+                self._check(entity_id)
+                self._relocate(entity_id, parent_id, name)
+            else:
+                self._check(parent_id)
+                if self._entities[parent_id]['concreteType'] == _FILE_TYPE:
+                    raise _http_error(
+                        'A file cannot contain other entities.', 409)
+                entity_id = self._children[parent_id].get(name)
+                if entity_id is not None and (not createOrUpdate or \
+                        self._entities[entity_id]['concreteType'] \
+                        != properties['concreteType']):
+                    raise _http_error(
+                        'An entity named ' + name + ' already exists.', 409)
+                if entity_id is None:
+                    entity_id = self._create(dict(properties))
+            if properties['concreteType'] == _FILE_TYPE and obj.path:
+                with open(obj.path, 'rb') as f:
+                    self._data[entity_id] = f.read()
+            obj.properties.update(self._entities[entity_id])
+        return obj
+
+    def delete(self, obj, version=None):
+        with self._lock:
+            entity_id = synapseclient.core.utils.id_of(obj)
+            properties = self._check(entity_id)
+            del self._children[properties['parentId']][properties['name']]
+            pending = [entity_id]
+            while pending:
+                entity_id = pending.pop()
+                pending.extend(self._children.pop(entity_id, {}).values())
+                self._entities.pop(entity_id)
+                self._data.pop(entity_id, None)
+
+    def restGET(self, uri, **kwargs):
+        with self._lock:
+            parts = uri.strip('/').split('/')
+            properties = self._check(parts[1])
+            if parts[2:] == ['type']:
+                return {'id': properties['id'], 'name': properties['name'],
+                        'type': properties['concreteType']}
+            return dict(properties)
+
+    def restPUT(self, uri, body=None, **kwargs):
+        with self._lock:
+            entity_id = uri.strip('/').split('/')[1]
+            properties = self._check(entity_id)
+            update = json.loads(body)
+            if update.get('etag') != properties['etag']:
+                raise _http_error(
+                    'Conflicting update, the etag does not match.', 409)
+            self._relocate(entity_id, update['parentId'], update['name'])
+            return dict(properties)
+
+
+def copy(syn, entity, destinationId, updateExisting=False, **kwargs):
+    """
+    @brief Fake of synapseutils.copy working on a FakeSynapse repository.
+
+    @returns a dict mapping the synIDs of the copied entities to the new ones.
+    """
+    with syn._lock:
+        entity_id = synapseclient.core.utils.id_of(entity)
+        properties = syn._check(entity_id)
+        if properties['name'] in syn._children[destinationId]:
+            raise ValueError('An item named ' + properties['name'] \
+                + ' already exists in ' + destinationId)
+        new_id = syn._create({'concreteType': properties['concreteType'],
+                              'name': properties['name'],
+                              'parentId': destinationId})
+        copied = {entity_id: new_id}
+        if entity_id in syn._data:
+            syn._data[new_id] = syn._data[entity_id]
+        for child_id in list(syn._children[entity_id].values()):
+            copied.update(copy(syn, child_id, new_id))
+        return copied
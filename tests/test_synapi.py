@@ -1,18 +1,63 @@
 """
-@brief  Unit tests to check the Synapse module.
+@brief   Unit tests to check the Synapse module.
+@details The tests run offline against an in-memory fake of Synapse. To run
+         them against Synapse too, set SYNAPI_LIVE=1. The Synapse 
+         credentials and the project where the tests are run are then read
+         from the SYNAPSE_USER, SYNAPSE_TOKEN and SYNAPSE_PROJECT environment 
+         variables. If any of them is missing, it is asked for when running
+         in a terminal, otherwise the live tests are skipped.
 @author Luis Carlos Garcia Peraza Herrera (luiscarlos.gph@gmail.com).
 @date   11 May 2022.
 """
 import unittest
+import sys
+import concurrent.futures
+import threading
 import tempfile
 import random
 import os
 import time
 import shutil
+import stat
+import unittest.mock
 import synapseclient
 
 # My imports
 import synapi
+import fake_synapse
+
+# Name of the pytest-xdist worker running the tests, so that parallel workers
+# do not clash in the shared project
+_WORKER = os.environ.get('PYTEST_XDIST_WORKER', 'gw0')
+
+
+def _unique(name: str) -> str:
+    """
+    @brief Make a file or folder name unique to this worker 
+           (e.g. foo.txt -> foo_gw0.txt).
+    """
+    root, ext = os.path.splitext(name)
+    return root + '_' + _WORKER + ext
+
+
+def _isdir(path: str) -> bool:
+    """
+    @brief Check that a path is a directory with a single stat() call.
+    """
+    return stat.S_ISDIR(os.stat(path).st_mode)
+
+
+def _credential(var: str, prompt: str) -> str:
+    """
+    @brief Read a credential from the environment, prompting for it only if
+           there is a terminal to answer.
+    """
+    value = os.environ.get(var)
+    if not value and sys.stdin is not None and sys.stdin.isatty():
+        value = input(prompt)
+    if not value:
+        raise unittest.SkipTest('Set ' + var + ' to run the Synapse tests.')
+    return value
 
 class TestSynapseMethods(unittest.TestCase):
 
@@ -26,96 +71,123 @@ class TestSynapseMethods(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
+        # Talking to Synapse needs an account and is slow, so it is opt-in
+        if os.environ.get('SYNAPI_LIVE') != '1':
+            raise unittest.SkipTest('Set SYNAPI_LIVE=1 to run the tests ' \
+                                    + 'against Synapse.')
+
         # Get the Synapse credentials to access the repo 
-        cls._username = input('Username: ')
-        cls._password = input('Password: ')
-        cls._project_id = input('Project id: ')
+        cls._username = _credential('SYNAPSE_USER', 'Username: ')
+        cls._auth_token = _credential('SYNAPSE_TOKEN', 'Access token: ')
+        cls._project_id = _credential('SYNAPSE_PROJECT', 'Project id: ')
+        cls._setUpSession()
 
-    def test_file_upload_and_download(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
-
-        # Create temporary file
-        upload_fname = 'test_synapse_methods_upload.txt'
-        download_fname = 'test_synapse_methods_download.txt'
-        remote_fname = 'test_synapse_methods_remote.txt'
-        upload_path = os.path.join(tempfile.gettempdir(), upload_fname) 
-        download_path = os.path.join(tempfile.gettempdir(), download_fname)
-        content = 'Testing SynapseSession upload and download.'
-        with open(upload_path, 'w') as f:
-            f.write(content)
+    @classmethod
+    def _setUpSession(cls):
+        # Log into Synapse only once for all the tests
+        cls._sess = synapi.SynapseSession(cls._username, None,
+                                          cls._project_id, 
+                                          auth_token=cls._auth_token)
+
+        # Local folder where the tests write their files, removed at the end
+        cls._tmp = tempfile.mkdtemp(prefix='synapi_tests_')
+
+        # Write the contents shared by all the test files only once
+        cls._content = b'Testing SynapseSession canonical fixture.'
+        cls._local_fixture = os.path.join(cls._tmp, 'fixture.txt')
+        with open(cls._local_fixture, 'wb') as f:
+            f.write(cls._content)
+
+        # Upload it only once too, the tests that just need a remote file 
+        # copy it within Synapse instead of uploading their own
+        cls._fixture = _unique('_fixture.txt')
+        cls._sess.upload(cls._local_fixture, cls._fixture)
 
-        # Upload file to Synapse
-        sess.upload(upload_path, remote_fname)
-        os.unlink(upload_path)
+    @classmethod
+    def tearDownClass(cls):
+        # Remove the shared fixture
+        cls._sess.rm(cls._fixture)
+
+        # Log out of Synapse
+        cls._sess.close()
+
+        # Remove the local files of the tests
+        shutil.rmtree(cls._tmp, ignore_errors=True)
+
+    def _assertFileMatches(self, path: str, expected: bytes):
+        """
+        @brief Check that a local file exists and holds the expected bytes.
+        """
+        # The open file is stat'ed, so that the path is not looked up twice
+        with open(path, 'rb') as f:
+            self.assertTrue(stat.S_ISREG(os.fstat(f.fileno()).st_mode))
+            data = f.read()
+        self.assertTrue(memoryview(data) == expected, 
+                        path + ' holds ' + repr(data[:64]))
+
+    def _assertRemoteMatches(self, sess, remote_name: str, expected: bytes):
+        """
+        @brief Download a remote file and check that it holds the expected 
+               bytes.
+        """
+        path = os.path.join(tempfile.mkdtemp(dir=self._tmp), 'download')
+        sess.download(remote_name, path)
+        self._assertFileMatches(path, expected)
 
-        # Download file from Synapse
-        sess.download(remote_fname, download_path)
-        
-        # Make sure the file was downloaded
-        self.assertTrue(os.path.isfile(download_path))
-        
-        # Read the contents of the downloaded file
-        with open(download_path, 'r') as f:
-            lines = f.readlines()
-        os.unlink(download_path)
+    def test_file_upload_and_download(self):
+        # Use the session shared by all the tests
+        sess = self._sess
 
-        # Check that the uploaded and downloaded files are the same
-        self.assertEqual(content, lines[0])
+        # Upload file to Synapse
+        remote_fname = _unique('test_synapse_methods_remote.txt')
+        sess.upload(self._local_fixture, remote_fname)
+        self.addCleanup(sess.rm, remote_fname)
 
-        # Remove test file from repo
-        sess.rm(remote_fname)
+        # Download file from Synapse and check that the uploaded and 
+        # downloaded files are the same
+        self._assertRemoteMatches(sess, remote_fname, self._content)
 
     def test_folder_upload_and_download(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Create a folder with a file inside it
-        folder_path = os.path.join(tempfile.gettempdir(), 'dummy_folder') 
+        folder_path = os.path.join(self._tmp, 'dummy_folder') 
         file_path = os.path.join(folder_path, 'dummy_file.txt')
-        if os.path.isdir(folder_path):
-            shutil.rmtree(folder_path)
-        os.mkdir(folder_path)
-        content = 'Testing SynapseSession upload and download.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload folder to Synapse
-        remote_fname = 'dummy_remote_folder'
-        sess.upload(folder_path, remote_fname)
-        shutil.rmtree(folder_path)
-
-        # Download folder from Synapse
-        download_fname = 'dummy_downloaded_folder'
-        download_path = os.path.join(tempfile.gettempdir(), download_fname)
-        sess.download(remote_fname, download_path)
-
-        # Check that the folder has been downloaded and contains the file
-        self.assertTrue(os.path.isdir(download_path))
-        self.assertTrue(os.path.isfile(os.path.join(download_path, 'dummy_file.txt')))
-
-        # Check the contents of the file
-        with open(os.path.join(download_path, 'dummy_file.txt'), 'r') as f:
-            lines = f.readlines()
-        shutil.rmtree(download_path)
-        self.assertEqual(content, lines[0])
-
-        # Remove folder from Synapse
-        sess.rm(remote_fname)
+        os.makedirs(folder_path, exist_ok=True)
+        shutil.copy(self._local_fixture, file_path)
+
+        # Try both a folder tree and a folder bundled in a single file
+        for bundle in [False, True]:
+            with self.subTest(bundle=bundle):
+                # Upload folder to Synapse
+                remote_fname = _unique('dummy_remote_folder_' + str(bundle))
+                sess.upload(folder_path, remote_fname, bundle=bundle)
+                self.addCleanup(sess.rm, remote_fname)
+
+                # Check that only the bundle is stored as a single file
+                self.assertEqual(sess.file_exists(remote_fname), bundle)
+
+                # Download folder from Synapse
+                download_path = os.path.join(self._tmp, 
+                    'dummy_downloaded_folder_' + str(bundle))
+                sess.download(remote_fname, download_path, bundle=bundle)
+
+                # Check that the folder has been downloaded and contains the
+                # file, with the same contents
+                self.assertTrue(_isdir(download_path))
+                self._assertFileMatches(os.path.join(download_path, 
+                                                     'dummy_file.txt'),
+                                        self._content)
 
     def test_mkdir(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Create remote folder
-        remote_path = 'foo1/foo2/foo3/foo4/foo5'
+        remote_path = _unique('foo1') + '/foo2/foo3/foo4/foo5'
         sess.mkdir(remote_path)
+        self.addCleanup(sess.rm, _unique('foo1'))
 
         # Check that the folder was successfully created
         self.assertTrue(sess.dir_exists(remote_path))
@@ -126,111 +198,87 @@ class TestSynapseMethods(unittest.TestCase):
         # Check that the folder no longer exists
         self.assertFalse(sess.dir_exists(remote_path))
 
-        # Remove the whole tree we created
-        sess.rm('foo1')
-        
-    def test_get_file_id(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
-        
-        # Write dummy file to disk
-        file_path = os.path.join(tempfile.gettempdir(), 'superfoo.txt') 
-        content = 'Testing SynapseSession upload and download.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload the file to Synapse using the Synapse API so we get the synID
-        data = synapseclient.File(path=file_path,
-                                  parent=TestSynapseMethods._project_id)
-        data = sess.syn.store(data)
-        gt_id = data.properties['id']
-
-        # Get the synID using our API
-        pred_id = sess.get_id('superfoo.txt')
-        
-        # Check that the ids match
-        self.assertEqual(pred_id, gt_id)
-
-        # Remove the file from the remote repository
-        sess.rm('superfoo.txt')
-
     def test_get_dir_id(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
  
         # Create a remote dir
-        folder_name = 'foo_test_dir'
+        folder_name = _unique('foo_test_dir')
         folder = synapseclient.Folder(name=folder_name,
-                                      parent=TestSynapseMethods._project_id)
+                                      parent=self._project_id)
         folder = sess.syn.store(folder)
+        self.addCleanup(sess.rm, folder_name)
 
         # Check we are able to retrieve the synID correctly 
         self.assertEqual(folder.properties['id'], sess.get_id(folder_name))
 
-        # Remove the directory from the remote repository
-        sess.rm(folder_name)
-
-    def test_file_exists(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+    def test_file_lifecycle(self):
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Check that file does not exist
-        fname = 'unit_test_file_exists.txt'
+        fname = _unique('unit_test_file_lifecycle.txt')
         self.assertFalse(sess.file_exists(fname))
 
-        # Write dummy file to disk
-        file_path = os.path.join(tempfile.gettempdir(), fname) 
-        content = 'Testing SynapseSession file exists method.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload dummy file
-        sess.upload(file_path, fname)
-        os.unlink(file_path)
+        # Create dummy file, only once for all the checks
+        sess.cp(self._fixture, fname)
 
         # Check that file now exists
-        self.assertTrue(sess.file_exists(fname))
-
-        # Delte dummy file
-        sess.rm(fname)
-
-    def test_file_rm(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
-
-        # Write dummy file to disk
-        fname = 'unit_test_file_exists.txt'
-        file_path = os.path.join(tempfile.gettempdir(), fname) 
-        content = 'Testing SynapseSession file remove method.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload file to remote repo
-        sess.upload(file_path, fname)
-        os.unlink(file_path)
-
-        # Delete file
-        sess.rm(fname)
-
-        # Make sure it no longer exists
-        self.assertFalse(sess.file_exists(fname))
+        with self.subTest('file_exists'):
+            self.assertTrue(sess.file_exists(fname))
+
+        # Check that our API gets the same synID as the Synapse API
+        with self.subTest('get_id'):
+            gt_id = sess.syn.findEntityId(fname, 
+                                          parent=self._project_id)
+            self.assertIsNotNone(gt_id)
+            self.assertEqual(sess.get_id(fname), gt_id)
+
+        # Delete file and make sure it no longer exists
+        with self.subTest('rm'):
+            sess.rm(fname)
+            self.assertFalse(sess.file_exists(fname))
+
+    def test_synapse_id_paths(self):
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        # Existing entities can be addressed by their synID
+        file_id = sess.get_id(self._fixture)
+        self.assertTrue(sess.file_exists(file_id))
+        self.assertFalse(sess.dir_exists(file_id))
+        self.assertTrue(sess.dir_exists(self._project_id))
+        self.assertFalse(sess.file_exists(self._project_id))
+
+        # A synID that does not exist is neither a file nor a folder
+        missing_id = 'syn999999999999'
+        self.assertFalse(sess.file_exists(missing_id))
+        self.assertFalse(sess.dir_exists(missing_id))
+        with self.assertRaises(ValueError):
+            sess.download(missing_id, os.path.join(self._tmp, 
+                                                   _unique('missing')))
+
+        # Neither does the synID of an entity whose ancestor was deleted
+        dirname = _unique('synapse_id_paths')
+        sess.mkdir(dirname + '/b')
+        sess.cp(self._fixture, dirname + '/b/c.txt')
+        dir_id = sess.get_id(dirname + '/b')
+        file_id = sess.get_id(dirname + '/b/c.txt')
+        self.assertTrue(sess.dir_exists(dir_id))
+        self.assertTrue(sess.file_exists(file_id))
+        sess.rm(dirname)
+        self.assertFalse(sess.dir_exists(dir_id))
+        self.assertFalse(sess.file_exists(file_id))
+        with self.assertRaises(ValueError):
+            sess.download(dir_id, os.path.join(self._tmp, 
+                                               _unique('deleted')))
 
     def test_dir_rm(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Make sure the directory does not exist 
-        dirname = 'test_dir_rm'
+        dirname = _unique('test_dir_rm')
         self.assertFalse(sess.dir_exists(dirname))
 
         # Create directory in Synapse
@@ -246,154 +294,295 @@ class TestSynapseMethods(unittest.TestCase):
         self.assertFalse(sess.dir_exists(dirname))
 
     def test_file_mv(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Create dummy file
-        fname = 'unit_test_file_mv.txt'
-        file_path = os.path.join(tempfile.gettempdir(), fname)
-        content = 'Testing SynapseSession file move method.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload dummy file
-        sess.upload(file_path, fname)
-        os.unlink(file_path)
+        fname = _unique('unit_test_file_mv.txt')
+        sess.cp(self._fixture, fname)
         
         self.assertTrue(sess.file_exists(fname))
 
         # Move dummy file
-        new_fname = 'this_is_the_new_file.txt'
+        new_fname = _unique('this_is_the_new_file.txt')
         sess.mv(fname, new_fname)
+        self.addCleanup(sess.rm, new_fname)
 
         self.assertFalse(sess.file_exists(fname))
         self.assertTrue(sess.file_exists(new_fname))
 
-        # Remove dummy file
-        sess.rm(new_fname)
-
     def test_dir_mv(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
-        # Create remote directory tree
-        sess.mkdir('superfoo1/superfoo2/superfoo3')
+        src = _unique('superfoo1')
+        dst = _unique('superdestfoo')
 
-        # Create remote directory
-        sess.mkdir('superdestfoo')
+        # Create the remote directory tree and the destination directory,
+        # which are independent, concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as ex:
+            list(ex.map(sess.mkdir, [src + '/superfoo2/superfoo3', dst]))
+        self.addCleanup(sess.rm, dst)
 
         # Make sure that the source folder exists
-        self.assertTrue(sess.dir_exists('superfoo1/superfoo2/superfoo3'))
-        self.assertTrue(sess.dir_exists('superdestfoo'))
+        self.assertTrue(sess.dir_exists(src + '/superfoo2/superfoo3'))
+        self.assertTrue(sess.dir_exists(dst))
 
         # Move directory
-        sess.mv('superfoo1', 'superdestfoo/newname')
+        sess.mv(src, dst + '/newname')
 
-        # Make sure that the destination folder exists
-        self.assertTrue(sess.dir_exists('superdestfoo/newname'))
-        self.assertTrue(sess.dir_exists('superdestfoo/newname/superfoo2'))
-        self.assertTrue(sess.dir_exists('superdestfoo/newname/superfoo2/superfoo3'))
+        # Make sure that the destination folder exists, listing it only once
+        tree = sess.list_tree(dst)
+        self.assertEqual(tree, set(['newname', 'newname/superfoo2',
+                                    'newname/superfoo2/superfoo3']))
 
         # Make sure that the source folder does not exist
-        self.assertFalse(sess.dir_exists('superfoo1'))
-
-        # Remove test folders
-        sess.rm('superdestfoo')
+        self.assertFalse(sess.dir_exists(src))
 
     def test_file_cp(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Create dummy file
-        fname = 'test_file_cp.txt'
-        file_path = os.path.join(tempfile.gettempdir(), fname)
-        content = 'Testing SynapseSession file copy method.'
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-        # Upload dummy file
-        sess.upload(file_path, fname)
-
-        # Delete local copy of the dummy file
-        os.unlink(file_path)
+        fname = _unique('test_file_cp.txt')
+        sess.cp(self._fixture, fname)
 
         # Copy the dummy file in the repo
-        new_fname = 'new_fname_test_file_cp.txt'
+        new_fname = _unique('new_fname_test_file_cp.txt')
         sess.cp(fname, new_fname)
 
+        # Once the test finishes, both files are deleted concurrently
+        self.addCleanup(sess.rm_many, [fname, new_fname])
+
         # Check that the copy exists
         self.assertTrue(sess.file_exists(new_fname))
 
-        # Download the copy
-        sess.download(new_fname, file_path)
-
-        # Check that it has the same contents
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-        self.assertEqual(content, lines[0])
-
-        # Remove the downloaded file (local)
-        os.unlink(file_path)
-
-        # Remove both remote files
-        sess.rm(fname)
-        sess.rm(new_fname)
+        # Download the copy and check that it has the same contents
+        self._assertRemoteMatches(sess, new_fname, self._content)
 
     def test_dir_cp(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        src = _unique('dir_cp_foo1')
+        dst = _unique('dir_cp_foo3')
 
         # Create a directory
-        sess.mkdir('dir_cp_foo1/dir_cp_foo2')
-        self.assertTrue(sess.dir_exists('dir_cp_foo1/dir_cp_foo2'))
+        sess.mkdir(src + '/dir_cp_foo2')
+        self.assertTrue(sess.dir_exists(src + '/dir_cp_foo2'))
 
         # Copy directory
-        sess.cp('dir_cp_foo1', 'dir_cp_foo3')
+        sess.cp(src, dst)
+        self.addCleanup(sess.rm_many, [src, dst])
         
         # Check that it was copied
-        self.assertTrue(sess.dir_exists('dir_cp_foo3'))
-        self.assertTrue(sess.dir_exists('dir_cp_foo3/dir_cp_foo2'))
-
-        # Remove unit test dirs
-        sess.rm('dir_cp_foo1')
-        sess.rm('dir_cp_foo3')
+        self.assertTrue(sess.dir_exists(dst))
+        self.assertTrue(sess.dir_exists(dst + '/dir_cp_foo2'))
+
+    def test_mv_cp_empty_paths(self):
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        # Neither the project itself nor a path onto it can be moved or copied
+        fname = _unique('mv_cp_empty_paths.txt')
+        for method in [sess.mv, sess.cp]:
+            for src, dst in [('', fname), ('/', fname), 
+                             (self._fixture, ''), (self._fixture, '/')]:
+                with self.subTest(method=method.__name__, src=src, dst=dst):
+                    with self.assertRaises(ValueError):
+                        method(src, dst)
+        self.assertFalse(sess.file_exists(fname))
+        self.assertTrue(sess.file_exists(self._fixture))
 
     def test_listdir(self):
-        # Log into Synapse
-        sess = synapi.SynapseSession(TestSynapseMethods._username,
-                                           TestSynapseMethods._password,
-                                           TestSynapseMethods._project_id)
+        # Use the session shared by all the tests
+        sess = self._sess
 
         # Create an empty folder in the repository
-        sess.mkdir('test_listdir')
+        dirname = _unique('test_listdir')
+        sess.mkdir(dirname)
+        self.addCleanup(sess.rm, dirname)
 
-        # Create a couple of dummy files
-        content = 'Testing SynapseSession listdir method.'
-        local_path = os.path.join(tempfile.gettempdir(), 'test_ls.txt') 
-        with open(local_path, 'w') as f:
-            f.write(content)
-        
         # Upload a couple of files to the folder
-        sess.upload(local_path, 'test_listdir/test_ls.txt')
-        sess.cp('test_listdir/test_ls.txt', 'test_listdir/test_ls2.txt')
+        sess.upload(self._local_fixture, dirname + '/test_ls.txt')
+        sess.cp(dirname + '/test_ls.txt', dirname + '/test_ls2.txt')
 
         # Create a folder inside
-        sess.mkdir('test_listdir/foo')
+        sess.mkdir(dirname + '/foo')
 
         # List directory
-        ls = set(sess.ls('test_listdir'))
+        ls = set(sess.ls(dirname))
         self.assertEqual(ls, set(['test_ls.txt', 'test_ls2.txt', 'foo']))
 
-        # Delete test folder
-        sess.rm('test_listdir')
+        # The same listing, as a list
+        ls_list = sess.ls_list(dirname)
+        self.assertIsInstance(ls_list, list)
+        self.assertEqual(sorted(ls_list), sorted(ls))
+
+    def test_upload_and_download_many(self):
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        # Create an empty folder in the repository
+        dirname = _unique('test_many')
+        sess.mkdir(dirname)
+        self.addCleanup(sess.rm, dirname)
+
+        # Upload several files, each pair is yielded once it is uploaded
+        names = ['many_' + str(i) + '.txt' for i in range(3)]
+        pairs = [(self._local_fixture, dirname + '/' + n) for n in names]
+        self.assertEqual(sorted(sess.upload_many(pairs)), sorted(pairs))
+        self.assertEqual(sorted(sess.ls_list(dirname)), names)
+
+        # Download them back
+        local_dir = tempfile.mkdtemp(dir=self._tmp)
+        pairs = [(dirname + '/' + n, os.path.join(local_dir, n)) \
+                 for n in names]
+        self.assertEqual(sorted(sess.download_many(pairs)), sorted(pairs))
+        for _, path in pairs:
+            self._assertFileMatches(path, self._content)
+
+    def test_close(self):
+        # Open a session of our own, the shared one is closed at the end
+        with synapi.SynapseSession(self._username, None, self._project_id,
+                                   auth_token=self._auth_token) as sess:
+            self.assertTrue(sess.file_exists(self._fixture))
+            logout = unittest.mock.patch.object(sess.syn, 'logout', 
+                                                wraps=sess.syn.logout)
+            self.addCleanup(logout.stop)
+            logout = logout.start()
+
+        # Leaving the context logged out, closing again does nothing
+        sess.close()
+        logout.assert_called_once_with()
+        with self.assertRaises(RuntimeError):
+            sess._pool.submit(print)
+
+
+class TestSynapseMethodsOffline(TestSynapseMethods):
+    """
+    @brief Same tests, run against an in-memory fake of Synapse.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Replace the Synapse client with the fake, for the whole class
+        cls._patches = [
+            unittest.mock.patch('synapseclient.Synapse', 
+                                fake_synapse.FakeSynapse),
+            unittest.mock.patch('synapseutils.copy', fake_synapse.copy),
+        ]
+        for p in cls._patches:
+            p.start()
+
+        # Any access token is accepted by the fake, the project is created
+        fake_synapse.FakeSynapse.reset()
+        cls._username = 'username'
+        cls._auth_token = 'token'
+        cls._project_id = fake_synapse.FakeSynapse.create_project('synapi')
+        cls._setUpSession()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestSynapseMethodsOffline, cls).tearDownClass()
+        for p in cls._patches:
+            p.stop()
+
+    def test_rm_many_with_failure(self):
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        # Create two folders, the deletion of the first one will fail
+        a = _unique('rm_many_a')
+        b = _unique('rm_many_b')
+        sess.mkdir(a)
+        sess.mkdir(b)
+        self.addCleanup(sess.rm, b)
+        b_id = sess.get_id(b)
+        delete = sess.syn.delete
+        def failing_delete(obj, *args, **kwargs):
+            if obj == b_id:
+                raise OSError('Deletion failed')
+            return delete(obj, *args, **kwargs)
+
+        # The failure is reported, but the other folder is deleted anyway. The
+        # project is listed first, so that its children are all in the cache
+        sess.ls_list('/')
+        with unittest.mock.patch.object(sess.syn, 'delete', failing_delete):
+            with self.assertRaises(OSError):
+                sess.rm_many([b, a])
+        self.assertFalse(sess.dir_exists(a))
+        self.assertIsNone(sess.syn.findEntityId(a, parent=self._project_id))
+        self.assertTrue(sess.dir_exists(b))
+
+    def test_transfer_many_with_failure(self):
+        # Use the session shared by all the tests
+        sess = self._sess
+
+        # The transfers that do not fail wait until the transfer pool is shut
+        # down, so that with a single transfer in flight the rest are still
+        # queued when the first one fails
+        shut_down = threading.Event()
+        started = []
+        def download(remote_path, local_path, parent_id=None):
+            if remote_path == 'missing':
+                raise ValueError('Download failed')
+            started.append(remote_path)
+            shut_down.wait()
+        shutdown = concurrent.futures.ThreadPoolExecutor.shutdown
+        def shutdown_and_release(ex, *args, **kwargs):
+            shut_down.set()
+            return shutdown(ex, *args, **kwargs)
+
+        # The failure is reported and the queued transfers never start
+        pairs = [('missing', 'a')] \
+            + [('file_' + str(i), str(i)) for i in range(3)]
+        with unittest.mock.patch.object(sess, 'download', download), \
+                unittest.mock.patch.object(concurrent.futures.ThreadPoolExecutor,
+                                           'shutdown', shutdown_and_release):
+            with self.assertRaises(ValueError):
+                list(sess.download_many(pairs, max_inflight=1))
+        self.assertLessEqual(len(started), 1)
+
+    def test_login_with_auth_token(self):
+        # The token is handed to the Synapse client
+        fake_login = fake_synapse.FakeSynapse.login
+        with unittest.mock.patch.object(fake_synapse.FakeSynapse, 'login', 
+                                        autospec=True, 
+                                        side_effect=fake_login) as login:
+            with synapi.SynapseSession('nobody', None, self._project_id,
+                                       auth_token='secret') as sess:
+                self.assertTrue(sess.file_exists(self._fixture))
+        login.assert_called_once_with(sess.syn, 'nobody', authToken='secret',
+                                      silent=True)
+
+    def test_login_without_credentials(self):
+        # Without a token or configured credentials the password is useless
+        with self.assertRaises(ValueError):
+            synapi.SynapseSession('nobody', 'password', self._project_id)
+
+    def test_login_with_configured_credentials(self):
+        # Pretend that the client has credentials configured for the user
+        fake_synapse.FakeSynapse.configured_users.add('somebody')
+        self.addCleanup(fake_synapse.FakeSynapse.configured_users.discard,
+                        'somebody')
+
+        # No token or password is needed then
+        with synapi.SynapseSession('somebody', None, self._project_id) as sess:
+            self.assertTrue(sess.file_exists(self._fixture))
+
+    def test_get_session(self):
+        # The same arguments give the same session
+        args = (_unique('get_session'), None, self._project_id)
+        sess = synapi.get_session(*args, auth_token='token')
+        self.assertIs(synapi.get_session(*args, auth_token='token'), sess)
+
+        # Once closed, it is replaced by a new one that works
+        sess.close()
+        new_sess = synapi.get_session(*args, auth_token='token')
+        self.addCleanup(new_sess.close)
+        self.assertIsNot(new_sess, sess)
+        self.assertTrue(new_sess.file_exists(self._fixture))
 
 
 if __name__ == '__main__':